@@ -129,6 +129,75 @@ def combined_matrix_setup(
     return [low_level_matrix] + matrices, [low_level_id_dict] + level_id_dicts
 
 
+def find_active_columns(*matrices):
+    """
+    Finds the columns that hold at least one non-zero entry in any of the input matrices.
+    Columns that are all-zero in every matrix (codes never predicted and never present in the gold standard)
+    contribute nothing to TP/FP/FN at any layer, and neither do the ancestors reachable only through them.
+    inputs:
+        matrices - 2d np.arrays (or scipy sparse matrices) sharing the same columns, e.g. preds and golds
+    returns a sorted 1d np.array of active column indices
+    """
+    active = np.zeros(matrices[0].shape[1], dtype=bool)
+    for matrix in matrices:
+        active |= np.asarray(abs(matrix).sum(axis=0)).ravel() > 0
+    return np.flatnonzero(active)
+
+
+def compact_code_ids(code_ids, active_columns):
+    """
+    Restricts a code-to-ID dictionary to the active columns and renumbers them consecutively.
+    The relative order of the codes is preserved, so column i of the compacted matrices corresponds to
+    column active_columns[i] of the full-vocabulary matrices.
+    inputs:
+        code_ids - a dictionary mapping codes to their ID in the full-vocabulary prediction/gold vectors
+        active_columns - a sorted 1d np.array of column indices to keep (as produced by find_active_columns)
+    returns a dictionary mapping the retained codes to their ID in the compacted vectors
+    """
+    new_ids = dict(zip(active_columns.tolist(), range(len(active_columns))))
+    return {code: new_ids[idx] for code, idx in code_ids.items() if idx in new_ids}
+
+
+def compact_eval_setup(preds, golds, code_ids):
+    """
+    Optional compaction stage to be applied before setting up the translation matrices.
+    Drops the columns that are all-zero in both preds and golds, so that the translation matrices and layer ID
+    dictionaries produced by setup_matrices_by_layer / combined_matrix_setup only cover the reachable ancestors.
+    Micro-level results on the compacted inputs are identical to those on the full-vocabulary inputs.
+    inputs:
+      preds - a numpy array, a matrix of predictions
+      golds - a numpy array, a matrix of true labels
+      code_ids - a dictionary mapping codes to their ID in the prediction/gold vectors
+    returns a tuple:
+        compacted_preds - preds restricted to the active columns
+        compacted_golds - golds restricted to the active columns
+        compacted_code_ids - a dictionary mapping the retained (full-vocabulary) codes to their compacted IDs
+        active_columns - a 1d np.array mapping compacted column IDs back to full-vocabulary column IDs
+    """
+    active_columns = find_active_columns(preds, golds)
+    compacted_code_ids = compact_code_ids(code_ids, active_columns)
+    return (
+        preds[:, active_columns],
+        golds[:, active_columns],
+        compacted_code_ids,
+        active_columns,
+    )
+
+
+def expand_compacted(matrix, active_columns, n_codes):
+    """
+    Maps a compacted leaf-level matrix back onto the full vocabulary, filling dropped columns with zeros.
+    inputs:
+        matrix - a 2d np.array with one column per active code
+        active_columns - a 1d np.array mapping compacted column IDs to full-vocabulary column IDs
+        n_codes - integer size of the full vocabulary
+    returns a 2d np.array of shape (matrix.shape[0], n_codes)
+    """
+    expanded = np.zeros((matrix.shape[0], n_codes), dtype=matrix.dtype)
+    expanded[:, active_columns] = matrix
+    return expanded
+
+
 def hierarchical_eval_setup(preds, golds, layer_matrices, max_onto_layers):
     """
     inputs:
@@ -244,6 +313,33 @@ if __name__ == "__main__":
         "With these combined predictions and gold standard labels across layers we can now apply the evaluation measures for the non-binary scenario in multi_level_eval.py"
     )
 
+    logging.info("========Compacted Evaluation Setup========")
+    logging.info("Code c.1 is neither predicted nor present in the gold standard:")
+    sparse_preds, sparse_golds = sample_matrix.copy(), sample_gold_matrix.copy()
+    sparse_preds[:, code_ids["c.1"]] = 0
+    sparse_golds[:, code_ids["c.1"]] = 0
+    (
+        compacted_preds,
+        compacted_golds,
+        compacted_code_ids,
+        active_columns,
+    ) = compact_eval_setup(sparse_preds, sparse_golds, code_ids)
+    logging.info(compacted_code_ids)
+    compacted_matrices, compacted_layer_id_dicts = combined_matrix_setup(
+        compacted_code_ids, translation_dict, max_layer=2
+    )
+    logging.info("Compacted layer ID dictionaries (ancestor c is no longer present)")
+    logging.info(compacted_layer_id_dicts)
+    compacted_combined_preds, compacted_combined_golds = hierarchical_eval_setup(
+        compacted_preds, compacted_golds, compacted_matrices, 2
+    )
+    logging.info(
+        "Combined vectors shrink from %d to %d columns"
+        % (combined_preds.shape[1], compacted_combined_preds.shape[1])
+    )
+    logging.info("Compacted prediction matrix mapped back to the full vocabulary")
+    logging.info(expand_compacted(compacted_preds, active_columns, len(code_ids)))
+
     # another example: about ICD9 graph
     logging.info("The ICD9 graph example")
     # load json to get the  translation_dict from icd-9
@@ -4,7 +4,11 @@ import numpy as np
 import pandas as pd
 from scipy.sparse import csr_matrix
 
-from .evaluation_setup import combined_matrix_setup, hierarchical_eval_setup
+from .evaluation_setup import (
+    combined_matrix_setup,
+    compact_eval_setup,
+    hierarchical_eval_setup,
+)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -251,7 +255,13 @@ def report_bin(pred, gold, code_id_dict):
 
 
 def hierarchical_evaluation(
-    pred, gold, code_ids, translation_dict, max_onto_layers=3, verbo=False
+    pred,
+    gold,
+    code_ids,
+    translation_dict,
+    max_onto_layers=3,
+    verbo=False,
+    compact=False,
 ):
     """
     A summary function for final reporting.
@@ -262,12 +272,17 @@ def hierarchical_evaluation(
         translation_dict    dictionary mapping codes to their ID in the prediction/gold vectors
         max_onto_layers           an integer describing the maximum layer (from the bottom up) within the ontology to be evaluated on
         verbo               whether to verbolise the translation matrices
+        compact             whether to drop codes absent from both pred and gold before building the translation matrices
+                            (see compact_eval_setup in evaluation_setup.py); the micro-level results are unchanged
     Return 4 variables:
         micro prec for the overall hierarchical evaluation,
         rec for the overall hierarchical evaluation,
         f1 for the overall hierarchical evaluation,
         the list of results per layer, from layer 1 (leaf node only) up to layer 4 (so there are 4 sets of results, each set has 3 metrics, i.e. micro prec,rec,f1).
     """
+    if compact:
+        pred, gold, code_ids, _ = compact_eval_setup(pred, gold, code_ids)
+        logging.info("compacted the evaluation to %d active codes" % len(code_ids))
     matrices, layer_id_dicts = combined_matrix_setup(
         code_ids, translation_dict, max_layer=max_onto_layers
     )
@@ -0,0 +1,212 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from .evaluation_setup import (
+    combined_matrix_setup,
+    compact_code_ids,
+    find_active_columns,
+)
+from .multi_level_eval import fn_matrix_mul, fp_matrix_mul, tp_matrix_mul
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+
+def per_document_counts(pred, gold, layer_matrices, max_onto_layers):
+    """
+    Calculation of per-document TP/FP/FN for each layer of the ontology.
+    Micro-level counts are sums over documents, so these only need to be computed once per system.
+    inputs:
+      pred - a numpy array, a matrix of predictions
+      gold - a numpy array, a matrix of true labels
+      layer_matrices - a list of sparse matrices translating the leaf nodes into layers of the ontology
+      max_onto_layers - an integer describing the maximum layer (from the bottom up) within the ontology to be evaluated on
+    returns a 3d np.array of shape (documents, 3, max_onto_layers + 1) holding TP, FP and FN in this order
+    """
+    counts = np.zeros((pred.shape[0], 3, max_onto_layers + 1))
+
+    pred_sparse = csr_matrix(pred)
+    gold_sparse = csr_matrix(gold)
+    for layer_ind in range(max_onto_layers + 1):
+        parent_pred_matrix = pred_sparse.dot(layer_matrices[layer_ind]).toarray()
+        parent_gold_matrix = gold_sparse.dot(layer_matrices[layer_ind]).toarray()
+        for count_ind, count_fn in enumerate(
+            (tp_matrix_mul, fp_matrix_mul, fn_matrix_mul)
+        ):
+            counts[:, count_ind, layer_ind] = count_fn(
+                parent_pred_matrix, parent_gold_matrix, 1
+            )
+    return counts
+
+
+def micro_f1_from_counts(counts):
+    """
+    Micro F1 from aggregated counts, following the zero-denominator handling of report_micro in multi_level_eval.py.
+    The overall (cross-layer) F1 is appended as the last entry - summing counts over layers is equivalent to
+    evaluating the concatenation produced by hierarchical_eval_setup.
+    inputs:
+        counts  np.array of shape (..., 3, layers) holding TP, FP and FN in this order
+    returns np.array of shape (..., layers + 1)
+    """
+    counts = np.concatenate([counts, counts.sum(axis=-1, keepdims=True)], axis=-1)
+    tp, fp, fn = counts[..., 0, :], counts[..., 1, :], counts[..., 2, :]
+
+    prec_denom = tp + fp
+    prec = tp / (prec_denom + (prec_denom == 0) * 1)
+
+    rec_denom = tp + fn
+    rec = tp / (rec_denom + (rec_denom == 0) * 1)
+
+    f1_denom = prec + rec
+    return 2 * (prec * rec) / (f1_denom + (f1_denom == 0) * 1)
+
+
+def _permutation_chunk(seed_seq, n_permutations, counts_a, counts_b, diffs, observed):
+    """
+    Runs a chunk of approximate-randomization permutations.
+    Each permutation is a random swap mask over documents. As micro counts are additive over documents,
+    the permuted counts of both systems follow from a single product of the masks with the per-document
+    count differences between the systems.
+    returns a 1d np.array counting, per layer and overall, the permutations reaching the observed difference
+    """
+    rng = np.random.default_rng(seed_seq)
+    swap_masks = rng.integers(0, 2, size=(n_permutations, diffs.shape[0]))
+    swapped = (swap_masks.astype(np.float64) @ diffs).reshape(
+        (n_permutations,) + counts_a.shape
+    )
+
+    f1_x = micro_f1_from_counts(counts_a + swapped)
+    f1_y = micro_f1_from_counts(counts_b - swapped)
+    return np.sum(np.abs(f1_x - f1_y) >= observed - 1e-12, axis=0)
+
+
+def paired_permutation_test(
+    pred_a,
+    pred_b,
+    gold,
+    code_ids,
+    translation_dict,
+    max_onto_layers=3,
+    n_permutations=10000,
+    chunk_size=500,
+    n_jobs=1,
+    seed=None,
+    compact=False,
+):
+    """
+    Paired approximate-randomization test between two systems on the hierarchical micro F1.
+    Per-document, per-layer TP/FP/FN are computed once for both systems; each permutation swaps the outputs of the
+    two systems for a random subset of documents and is evaluated from these counts without re-running the translation.
+    inputs:
+        pred_a              2d np.array prediction matrix of the first system
+        pred_b              2d np.array prediction matrix of the second system
+        gold                2d np.array matrix of gold standard labels
+        code_ids            dictionary mapping codes to their ID in the prediction/gold vectors
+        translation_dict    dictionary containing the codes' ordered parent list
+        max_onto_layers     an integer describing the maximum layer (from the bottom up) within the ontology to be evaluated on
+        n_permutations      number of random permutations
+        chunk_size          number of permutations evaluated at once (bounds the memory of the swap masks)
+        n_jobs              number of worker processes the chunks are distributed across
+        seed                seed for the permutations; results do not depend on n_jobs
+        compact             whether to drop codes absent from all inputs before building the translation matrices
+    returns a dictionary:
+        "overall" - a dictionary with "F1_a", "F1_b", and "p_value" for the overall hierarchical evaluation
+        "layers"  - a list of such dictionaries per layer, from layer 1 (leaf node only) up to max_onto_layers + 1
+    """
+    if compact:
+        active_columns = find_active_columns(pred_a, pred_b, gold)
+        code_ids = compact_code_ids(code_ids, active_columns)
+        pred_a, pred_b, gold = (
+            pred_a[:, active_columns],
+            pred_b[:, active_columns],
+            gold[:, active_columns],
+        )
+    matrices, _ = combined_matrix_setup(
+        code_ids, translation_dict, max_layer=max_onto_layers
+    )
+
+    doc_counts_a = per_document_counts(pred_a, gold, matrices, max_onto_layers)
+    doc_counts_b = per_document_counts(pred_b, gold, matrices, max_onto_layers)
+    counts_a, counts_b = doc_counts_a.sum(axis=0), doc_counts_b.sum(axis=0)
+    diffs = (doc_counts_b - doc_counts_a).reshape((doc_counts_a.shape[0], -1))
+
+    f1_a, f1_b = micro_f1_from_counts(counts_a), micro_f1_from_counts(counts_b)
+    observed = np.abs(f1_a - f1_b)
+
+    chunk_sizes = [chunk_size] * (n_permutations // chunk_size)
+    if n_permutations % chunk_size:
+        chunk_sizes.append(n_permutations % chunk_size)
+    seed_seqs = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    chunk_args = [
+        (seed_seq, size, counts_a, counts_b, diffs, observed)
+        for seed_seq, size in zip(seed_seqs, chunk_sizes)
+    ]
+
+    if n_jobs == 1:
+        exceed_counts = [_permutation_chunk(*args) for args in chunk_args]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            exceed_counts = list(executor.map(_permutation_chunk, *zip(*chunk_args)))
+    p_values = (np.sum(exceed_counts, axis=0) + 1) / (n_permutations + 1)
+
+    results = [
+        dict({"F1_a": f1_a[ind], "F1_b": f1_b[ind], "p_value": p_values[ind]})
+        for ind in range(max_onto_layers + 2)
+    ]
+    return dict({"overall": results[-1], "layers": results[:-1]})
+
+
+if __name__ == "__main__":
+    logging.info(f"Paired Significance Test Demonstration")
+    logging.info(f"Vectors correspond to leafs: \n(a.1, a.2, a.3, b.1, b.2, c.1, d)")
+
+    code_list = ["a.1", "a.2", "a.3", "b.1", "b.2", "c.1", "d"]
+    code_ids = dict(zip(code_list, range(len(code_list))))
+    translation_dict = dict(
+        {
+            "a.1": dict({"parents": ["a", "AB", "@"]}),
+            "a.2": dict({"parents": ["a", "AB", "@"]}),
+            "a.3": dict({"parents": ["a", "AB", "@"]}),
+            "b.1": dict({"parents": ["b", "AB", "@"]}),
+            "b.2": dict({"parents": ["b", "AB", "@"]}),
+            "c.1": dict({"parents": ["c", "CD", "@"]}),
+            "a": dict({"parents": ["a", "AB", "@"]}),
+            "b": dict({"parents": ["b", "AB", "@"]}),
+            "c": dict({"parents": ["c", "CD", "@"]}),
+            "d": dict({"parents": ["d", "CD", "@"]}),
+            "AB": dict({"parents": ["@", "@", "@"]}),
+            "CD": dict({"parents": ["@", "@", "@"]}),
+        }
+    )
+
+    rng = np.random.default_rng(0)
+    gold_matrix = (rng.random((200, len(code_list))) < 0.3) * 1
+    logging.info("System A recovers most gold labels, system B is closer to random")
+    pred_matrix_a = np.where(rng.random(gold_matrix.shape) < 0.9, gold_matrix, 0)
+    pred_matrix_b = np.where(
+        rng.random(gold_matrix.shape) < 0.6,
+        gold_matrix,
+        (rng.random(gold_matrix.shape) < 0.3) * 1,
+    )
+
+    results = paired_permutation_test(
+        pred_matrix_a,
+        pred_matrix_b,
+        gold_matrix,
+        code_ids,
+        translation_dict,
+        max_onto_layers=2,
+        n_permutations=10000,
+        seed=0,
+    )
+    logging.info("overall hierarchical evaluation:")
+    logging.info(results["overall"])
+    for layer_ind, layer_results in enumerate(results["layers"]):
+        logging.info("result at layer %s" % str(layer_ind + 1))
+        logging.info(layer_results)